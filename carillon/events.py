@@ -0,0 +1,122 @@
+"""Blocking event loop for the sort session: keys, timers and background results."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+import heapq
+import itertools
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Optional, TextIO
+
+
+class EventLoop:
+    """
+    Multiplexes keypresses, timers and events posted from other threads.
+    next_event() sleeps in select() until one of them is ready, so an idle
+    session uses no CPU. On POSIX stdin is watched directly; on Windows,
+    where select() only takes sockets, a daemon thread blocks on key reads
+    and posts them instead.
+    """
+
+    def __init__(self, read_key: Callable[[], Optional[str]], stdin: TextIO | None = None) -> None:
+        self._read_key = read_key
+        self._selector = selectors.DefaultSelector()
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._selector.register(self._wake_reader, selectors.EVENT_READ, "wake")
+        self._events: deque[tuple[str, Any]] = deque()
+        self._lock = threading.Lock()
+        self._timers: list[list] = []
+        self._sequence = itertools.count()
+
+        stdin = stdin or sys.stdin
+        if os.name == "nt":
+            threading.Thread(target=self._pump_keys, daemon=True).start()
+        else:
+            self._selector.register(stdin.fileno(), selectors.EVENT_READ, "key")
+
+    def _pump_keys(self) -> None:
+        while True:
+            key = self._read_key()
+            if key is not None:
+                self.post("key", key)
+
+    def post(self, kind: str, payload: Any = None) -> None:
+        """Queues an event; safe to call from any thread."""
+        with self._lock:
+            self._events.append((kind, payload))
+        try:
+            self._wake_writer.send(b"\0")
+        except OSError:
+            pass
+
+    def call_later(self, delay: float, kind: str, payload: Any = None) -> list:
+        """Delivers (kind, payload) after `delay` seconds; returns a handle for cancel()."""
+        timer = [time.monotonic() + delay, next(self._sequence), kind, payload, True]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    @staticmethod
+    def cancel(timer: list) -> None:
+        timer[4] = False
+
+    def next_event(self) -> tuple[str, Any]:
+        """Blocks until the next key, due timer or posted event."""
+        while True:
+            with self._lock:
+                if self._events:
+                    return self._events.popleft()
+
+            while self._timers and not self._timers[0][4]:
+                heapq.heappop(self._timers)
+            now = time.monotonic()
+            if self._timers and self._timers[0][0] <= now:
+                timer = heapq.heappop(self._timers)
+                return timer[2], timer[3]
+            timeout = self._timers[0][0] - now if self._timers else None
+
+            for key, _ in self._selector.select(timeout):
+                if key.data == "key":
+                    char = self._read_key()
+                    if char is None:
+                        # stdin closed; stop watching it rather than spinning on EOF
+                        self._selector.unregister(key.fileobj)
+                        continue
+                    with self._lock:
+                        self._events.append(("key", char))
+                else:
+                    try:
+                        while self._wake_reader.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+
+    def next_key(self) -> str:
+        """Blocks until a key arrives; other events stay queued in order."""
+        deferred: list[tuple[str, Any]] = []
+        while True:
+            kind, payload = self.next_event()
+            if kind == "key":
+                with self._lock:
+                    self._events.extendleft(reversed(deferred))
+                return payload
+            deferred.append((kind, payload))
+
+    def drain(self) -> list[tuple[str, Any]]:
+        """Returns and clears the queued events without waiting."""
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def close(self) -> None:
+        self._selector.close()
+        self._wake_reader.close()
+        self._wake_writer.close()
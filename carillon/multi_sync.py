@@ -0,0 +1,144 @@
+"""Multi-account sync: one crawl process per account, one database writer."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+import multiprocessing
+import os
+from typing import Iterable, Optional
+
+from carillon.database_worker import (
+    CATALOG_KINDS,
+    DatabaseConfig,
+    DatabaseWorker,
+    SyncChanges,
+    chunked,
+)
+from carillon.spotify_worker import SpotifyWorker
+
+# Per-process state for pool workers. The parent signs every account in
+# once and hands the access tokens over, so workers never refresh tokens,
+# open a browser or write to the database.
+_process_config: Optional[DatabaseConfig] = None
+_process_tokens: dict[str, str] = {}
+_process_workers: dict[str, SpotifyWorker] = {}
+
+
+def _init_process(config: DatabaseConfig, tokens: dict[str, str]) -> None:
+    global _process_config
+    _process_config = config
+    _process_tokens.clear()
+    _process_tokens.update(tokens)
+    _process_workers.clear()
+
+
+def _spotify_for(account_id: str) -> SpotifyWorker:
+    spotify = _process_workers.get(account_id)
+    if spotify is None:
+        # Never connected; SpotifyWorker only needs the database to sign in
+        spotify = SpotifyWorker(DatabaseWorker(_process_config), account_id=account_id)
+        spotify.use_access_token(_process_tokens[account_id])
+        _process_workers[account_id] = spotify
+    return spotify
+
+
+def _crawl_account(task: tuple[str, dict[str, str], set[str]]) -> dict:
+    """Crawls one account's playlists, saved albums and liked songs."""
+    account_id, known_snapshots, known_album_ids = task
+    spotify = _spotify_for(account_id)
+    playlist_ids, playlists = spotify.crawl_playlists(known_snapshots)
+    album_ids, albums = spotify.crawl_saved_albums(known_album_ids)
+    return {
+        "account_id": account_id,
+        "playlist_ids": playlist_ids,
+        "playlists": playlists,
+        "album_ids": album_ids,
+        "albums": albums,
+        "liked": spotify.fetch_liked_track_ids(),
+    }
+
+
+def _fetch_catalog(task: tuple[str, str, list[str]]) -> tuple[str, list[dict]]:
+    """Fetches track, album, artist or audio-feature objects using one account's client."""
+    account_id, kind, ids = task
+    spotify = _spotify_for(account_id)
+    return kind, getattr(spotify, f"fetch_{kind}s")(ids)
+
+
+class MultiAccountSync:
+    """
+    Syncs several accounts into one database.
+    Each account's library crawl runs in a pool process, and catalog
+    metadata (tracks, albums, artists, audio features) is deduplicated across accounts and
+    fetched in parallel chunks spread over every account's connection.
+    Only the parent process signs in and writes to the database, so
+    accounts refresh their tokens once and crawls never contend for the
+    SQLite write lock.
+    """
+
+    # Catalog ids per pool task; a multiple of every API batch size.
+    CHUNK_SIZE = 200
+
+    def __init__(
+        self,
+        db: DatabaseWorker,
+        account_ids: Iterable[str],
+        processes: int | None = None,
+    ) -> None:
+        self.db = db
+        self.account_ids = list(account_ids)
+        if not self.account_ids:
+            raise ValueError("MultiAccountSync needs at least one account.")
+        self.processes = processes or os.cpu_count() or 1
+
+    def _catalog_tasks(self, kind: str, ids: list[str]) -> list[tuple[str, str, list[str]]]:
+        return [
+            (self.account_ids[index % len(self.account_ids)], kind, chunk)
+            for index, chunk in enumerate(chunked(ids, self.CHUNK_SIZE))
+        ]
+
+    def _sign_in(self) -> dict[str, str]:
+        """Signs every account in one after another and returns their access tokens."""
+        tokens: dict[str, str] = {}
+        for account_id in self.account_ids:
+            print(f"[Sync] Signing in {account_id}...")
+            spotify = SpotifyWorker(self.db, account_id=account_id)
+            spotify.authenticate()
+            tokens[account_id] = spotify.access_token
+        return tokens
+
+    def run(self) -> SyncChanges:
+        db = self.db
+        db.init()
+        tokens = self._sign_in()
+        changes = SyncChanges()
+
+        print(f"\n[Sync] Updating {len(self.account_ids)} accounts with {self.processes} processes...")
+        with multiprocessing.Pool(self.processes, initializer=_init_process, initargs=(db.config, tokens)) as pool:
+            known_snapshots = db.known_snapshots()
+            known_album_ids = db.known_album_ids()
+            tasks = [(account_id, known_snapshots, known_album_ids) for account_id in self.account_ids]
+            for crawl in pool.imap_unordered(_crawl_account, tasks):
+                account_id = crawl["account_id"]
+                print(f"[Sync] {account_id}: {len(crawl['playlist_ids'])} playlists, "
+                      f"{len(crawl['album_ids'])} albums, {len(crawl['liked'])} liked songs")
+                db.write_account_library(
+                    account_id,
+                    crawl["playlist_ids"],
+                    crawl["playlists"],
+                    crawl["album_ids"],
+                    crawl["albums"],
+                    crawl["liked"],
+                    changes,
+                )
+
+            for kind in CATALOG_KINDS:
+                ids = db.missing_ids(kind)
+                print(f"[Sync] {kind.replace('_', ' ').title()} metadata: {len(ids)} to fetch...")
+                for _, objects in pool.imap_unordered(_fetch_catalog, self._catalog_tasks(kind, ids)):
+                    db.write_catalog(kind, objects, changes)
+
+        db.finish_sync(changes)
+        print("[Sync] Complete.")
+        return changes
@@ -0,0 +1,237 @@
+"""Declarative playlist reconciliation: turn a playlist into a desired track list."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+import bisect
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import spotipy
+
+from carillon.database_worker import DatabaseWorker, chunked
+from carillon.spotify_worker import SpotifyWorker
+
+# Spotify accepts at most 100 tracks per add or remove request.
+BATCH_SIZE = 100
+
+
+@dataclass
+class ReconcilePlan:
+    """
+    Operations that turn `current` into `desired`, applied in this order:
+    removals (positions in the current list), then (range_start,
+    insert_before, range_length) moves on the list left after removals,
+    then insertions at their final positions. When those would take more
+    requests than rewriting the playlist, `replacement` holds the whole
+    desired list instead and the other operations are empty.
+    """
+
+    playlist_id: str
+    snapshot_id: str
+    removals: list[tuple[str, int]] = field(default_factory=list)
+    moves: list[tuple[int, int, int]] = field(default_factory=list)
+    insertions: list[tuple[int, list[str]]] = field(default_factory=list)
+    replacement: Optional[list[str]] = None
+
+    @property
+    def request_count(self) -> int:
+        if self.replacement is not None:
+            return rewrite_request_count(len(self.replacement))
+        removal_requests = -(-len(self.removals) // BATCH_SIZE)
+        insertion_requests = sum(-(-len(track_ids) // BATCH_SIZE) for _, track_ids in self.insertions)
+        return removal_requests + len(self.moves) + insertion_requests
+
+    def __bool__(self) -> bool:
+        return bool(self.removals or self.moves or self.insertions) or self.replacement is not None
+
+
+def rewrite_request_count(track_count: int) -> int:
+    """Requests needed to replace a playlist's contents: one replace, then appends of BATCH_SIZE."""
+    return max(1, -(-track_count // BATCH_SIZE))
+
+
+def _longest_increasing_subsequence(values: list[int]) -> set[int]:
+    """Returns the indices of one longest strictly increasing subsequence."""
+    tails: list[int] = []
+    tail_indices: list[int] = []
+    previous = [-1] * len(values)
+    for index, value in enumerate(values):
+        slot = bisect.bisect_left(tails, value)
+        if slot:
+            previous[index] = tail_indices[slot - 1]
+        if slot == len(tails):
+            tails.append(value)
+            tail_indices.append(index)
+        else:
+            tails[slot] = value
+            tail_indices[slot] = index
+    kept: set[int] = set()
+    index = tail_indices[-1] if tail_indices else -1
+    while index != -1:
+        kept.add(index)
+        index = previous[index]
+    return kept
+
+
+def plan_reconciliation(playlist_id: str, snapshot_id: str, current: list[str], desired: list[str]) -> ReconcilePlan:
+    """
+    Computes a minimal edit from `current` to `desired`, or a full rewrite
+    when that takes fewer requests; a rewrite resets the tracks' added
+    dates, so ties keep the edit.
+    """
+    plan = _edit_plan(playlist_id, snapshot_id, current, desired)
+    if plan.request_count > rewrite_request_count(len(desired)):
+        return ReconcilePlan(playlist_id, snapshot_id, replacement=list(desired))
+    return plan
+
+
+def _edit_plan(playlist_id: str, snapshot_id: str, current: list[str], desired: list[str]) -> ReconcilePlan:
+    """
+    Surplus copies are removed, tracks outside a longest in-order run are
+    moved in contiguous blocks, and missing tracks are inserted in
+    contiguous runs.
+    """
+    plan = ReconcilePlan(playlist_id, snapshot_id)
+
+    # Keep the first n copies of each track where n is its count in desired
+    budget = Counter(desired)
+    kept: list[str] = []
+    for position, track_id in enumerate(current):
+        if budget[track_id] > 0:
+            budget[track_id] -= 1
+            kept.append(track_id)
+        else:
+            plan.removals.append((track_id, position))
+
+    # Desired slots covered by kept tracks, in order; the rest are insertions
+    available = Counter(kept)
+    slots: dict[str, list[int]] = defaultdict(list)
+    missing: list[int] = []
+    for index, track_id in enumerate(desired):
+        if available[track_id] > 0:
+            available[track_id] -= 1
+            slots[track_id].append(index)
+        else:
+            missing.append(index)
+
+    # Rank of each kept track in the target order; duplicates take slots in order
+    covered = sorted(index for indices in slots.values() for index in indices)
+    rank_of_slot = {index: rank for rank, index in enumerate(covered)}
+    next_slot: Counter = Counter()
+    ranks: list[int] = []
+    for track_id in kept:
+        ranks.append(rank_of_slot[slots[track_id][next_slot[track_id]]])
+        next_slot[track_id] += 1
+
+    # Everything outside the longest increasing run moves after its predecessor,
+    # together with the tracks that already follow it in target order
+    in_place = _longest_increasing_subsequence(ranks)
+    moving = {rank for index, rank in enumerate(ranks) if index not in in_place}
+    working = list(ranks)
+    for rank in sorted(moving):
+        if rank not in moving:
+            continue
+        start = working.index(rank)
+        length = 1
+        while start + length < len(working) and working[start + length] == rank + length and rank + length in moving:
+            length += 1
+        moving.difference_update(range(rank, rank + length))
+        insert_before = working.index(rank - 1) + 1 if rank else 0
+        if insert_before == start:
+            continue
+        block = working[start:start + length]
+        del working[start:start + length]
+        target = insert_before - length if insert_before > start else insert_before
+        working[target:target] = block
+        plan.moves.append((start, insert_before, length))
+
+    # Missing tracks go in as contiguous runs at their final positions
+    run: list[int] = []
+    for index in missing + [None]:
+        if run and (index is None or index != run[-1] + 1):
+            for offset, batch in enumerate(chunked((desired[i] for i in run), BATCH_SIZE)):
+                plan.insertions.append((run[0] + offset * BATCH_SIZE, batch))
+            run = []
+        if index is not None:
+            run.append(index)
+    return plan
+
+
+class PlaylistReconciler:
+    """
+    Brings playlists in line with desired track lists using the database's
+    copy of their contents. Every request carries the expected snapshot_id;
+    if the live playlist has moved on, or a request is rejected, the
+    contents are re-read from Spotify and the diff is recomputed.
+    """
+
+    def __init__(self, db: DatabaseWorker, spotify: SpotifyWorker, max_attempts: int = 3) -> None:
+        self.db = db
+        self.spotify = spotify
+        self.max_attempts = max_attempts
+
+    def _live_snapshot(self, playlist_id: str) -> str:
+        return self.spotify.sp.playlist(playlist_id, fields="snapshot_id").get("snapshot_id", "")
+
+    def plan(self, playlist_id: str, desired: Iterable[str]) -> ReconcilePlan:
+        """Diffs against the database copy without touching Spotify."""
+        snapshot_id, current = self.db.get_playlist_tracks(playlist_id)
+        return plan_reconciliation(playlist_id, snapshot_id, current, list(desired))
+
+    def _execute(self, plan: ReconcilePlan) -> str:
+        spotify = self.spotify
+        snapshot_id = plan.snapshot_id
+        if plan.replacement is not None:
+            return spotify.replace_playlist_tracks(plan.playlist_id, plan.replacement)
+
+        # Highest positions first so earlier positions stay valid between batches
+        removals = sorted(plan.removals, key=lambda removal: removal[1], reverse=True)
+        for batch in chunked(removals, BATCH_SIZE):
+            positions: dict[str, list[int]] = defaultdict(list)
+            for track_id, position in batch:
+                positions[track_id].append(position)
+            snapshot_id = spotify.remove_playlist_positions(plan.playlist_id, positions, snapshot_id)
+
+        for start, insert_before, length in plan.moves:
+            snapshot_id = spotify.reorder_playlist(plan.playlist_id, start, insert_before, snapshot_id, length)
+
+        for position, track_ids in plan.insertions:
+            snapshot_id = spotify.add_tracks_to_playlist(plan.playlist_id, track_ids, position=position)
+        return snapshot_id
+
+    def apply(self, playlist_id: str, desired: Iterable[str]) -> ReconcilePlan:
+        """Reconciles one playlist and records the result; returns the plan that was applied."""
+        desired = list(desired)
+        snapshot_id, current = self.db.get_playlist_tracks(playlist_id)
+        for attempt in range(1, self.max_attempts + 1):
+            live_snapshot = self._live_snapshot(playlist_id)
+            if live_snapshot != snapshot_id:
+                print(f"  [Reconcile] {playlist_id} changed on Spotify; re-reading contents.")
+                current = self.spotify.fetch_playlist_track_ids(playlist_id)
+                snapshot_id = live_snapshot
+                self.db.set_playlist_tracks(playlist_id, current, snapshot_id)
+
+            plan = plan_reconciliation(playlist_id, snapshot_id, current, desired)
+            if not plan:
+                return plan
+
+            try:
+                final_snapshot = self._execute(plan)
+            except spotipy.SpotifyException as e:
+                if attempt == self.max_attempts or e.http_status in (401, 403, 404):
+                    raise
+                print(f"  [Reconcile] Conflict on {playlist_id} ({e.http_status}); re-diffing.")
+                snapshot_id = ""
+                continue
+
+            if self._live_snapshot(playlist_id) == final_snapshot:
+                self.db.set_playlist_tracks(playlist_id, desired, final_snapshot)
+                return plan
+            # Someone else edited during our run; verify from scratch
+            print(f"  [Reconcile] {playlist_id} was edited concurrently; re-diffing.")
+            snapshot_id = ""
+
+        raise RuntimeError(f"Could not reconcile {playlist_id} after {self.max_attempts} attempts.")
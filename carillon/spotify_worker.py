@@ -1,14 +1,16 @@
 from __future__ import annotations
-from typing import Optional, List, Dict, Any, Generator
+from typing import Optional, List, Dict, Any, Callable, Generator, Iterable, Tuple
 
 import spotipy
+from spotipy.cache_handler import MemoryCacheHandler
 from spotipy.oauth2 import SpotifyOAuth
-from carillon.database_worker import DatabaseWorker
+from carillon.database_worker import DEFAULT_ACCOUNT, DatabaseWorker, chunked
 
 class SpotifyWorker:
     """
     Handles Spotify API interactions using spotipy.
-    Manages authentication tokens via the shared SQLite database.
+    Manages authentication tokens via the shared SQLite database,
+    scoped to one account (the default account uses the global Settings).
     """
     
     # Constants for DB keys - must match C# Variables.Settings
@@ -32,11 +34,13 @@ class SpotifyWorker:
     
     REDIRECT_URI = "http://127.0.0.1:5543/callback"
 
-    def __init__(self, db_worker: DatabaseWorker):
+    def __init__(self, db_worker: DatabaseWorker, account_id: str = DEFAULT_ACCOUNT):
         self.db = db_worker
+        self.account_id = account_id
         self.sp: Optional[spotipy.Spotify] = None
         self.client_id: Optional[str] = None
         self.client_secret: Optional[str] = None
+        self.access_token: Optional[str] = None
 
     def authenticate(self) -> None:
         """
@@ -44,24 +48,29 @@ class SpotifyWorker:
         Otherwise, triggers the OAuth flow and saves new tokens.
         """
         # 1. Load Credentials
-        self.client_id = self.db.get_setting(self.KEY_CLIENT_ID)
-        self.client_secret = self.db.get_setting(self.KEY_CLIENT_SECRET)
+        self.client_id = self.db.get_account_setting(self.account_id, self.KEY_CLIENT_ID)
+        self.client_secret = self.db.get_account_setting(self.account_id, self.KEY_CLIENT_SECRET)
         
         if not self.client_id or not self.client_secret:
-            raise ValueError("Client ID or Secret missing from Database. Please set SW_ClientToken and SW_ClientSecret.")
+            raise ValueError(
+                f"Client ID or Secret missing from Database for account '{self.account_id}'. "
+                "Please set SW_ClientToken and SW_ClientSecret."
+            )
 
         # 2. Try to load existing tokens
-        access_token = self.db.get_setting(self.KEY_ACCESS_TOKEN)
-        refresh_token = self.db.get_setting(self.KEY_REFRESH_TOKEN)
+        access_token = self.db.get_account_setting(self.account_id, self.KEY_ACCESS_TOKEN)
+        refresh_token = self.db.get_account_setting(self.account_id, self.KEY_REFRESH_TOKEN)
         
         # 3. Initialize the Auth Manager
-        # We use a custom cache handler or manually manage tokens to integrate with DB
+        # Tokens live in the DB per account, so keep spotipy's cache in memory
+        # instead of a shared .cache file that would mix accounts up
         auth_manager = SpotifyOAuth(
             client_id=self.client_id,
             client_secret=self.client_secret,
             redirect_uri=self.REDIRECT_URI,
             scope=" ".join(self.SCOPES),
-            open_browser=True
+            open_browser=True,
+            cache_handler=MemoryCacheHandler(),
         )
 
         token_info = None
@@ -88,18 +97,26 @@ class SpotifyWorker:
         if token_info:
             self._save_tokens(token_info)
             # Initialize the client with the fresh access token
-            self.sp = spotipy.Spotify(auth=token_info['access_token'])
+            self.use_access_token(token_info['access_token'])
             print("Authentication Successful.")
         else:
             raise ConnectionError("Failed to retrieve valid tokens.")
 
+    def use_access_token(self, access_token: str) -> None:
+        """
+        Connects with an access token another worker obtained for this account,
+        e.g. in a pool process, without refreshing it or touching the DB.
+        """
+        self.access_token = access_token
+        self.sp = spotipy.Spotify(auth=access_token)
+
     def _save_tokens(self, token_info: dict) -> None:
         """Saves access and refresh tokens to the SQLite DB."""
         if 'access_token' in token_info:
-            self.db.set_setting(self.KEY_ACCESS_TOKEN, token_info['access_token'])
+            self.db.set_account_setting(self.account_id, self.KEY_ACCESS_TOKEN, token_info['access_token'])
         
         if 'refresh_token' in token_info:
-            self.db.set_setting(self.KEY_REFRESH_TOKEN, token_info['refresh_token'])
+            self.db.set_account_setting(self.account_id, self.KEY_REFRESH_TOKEN, token_info['refresh_token'])
             
         print("Tokens saved to Database.")
 
@@ -125,7 +142,10 @@ class SpotifyWorker:
             print(f"Shuffle Error: {e}")
 
     def has_active_playback(self) -> bool:
-        """Returns True if there is an active playback device currently playing."""
+        """
+        Returns True if a playback device is available, whether or not it is
+        playing; a song that just ended leaves the device paused, not gone.
+        """
         if not self.sp:
             raise ConnectionError("Not authenticated.")
 
@@ -135,10 +155,32 @@ class SpotifyWorker:
             print(f"Playback Status Error: {e}")
             return False
 
-        if not playback:
-            return False
+        return playback is not None
 
-        return bool(playback.get("is_playing"))
+    def get_playback_progress(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the current item's track_id, progress_ms, duration_ms and
+        is_playing, or None when nothing is loaded on any device.
+        """
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        try:
+            playback = self.sp.current_playback()
+        except spotipy.SpotifyException as e:
+            print(f"Playback Status Error: {e}")
+            return None
+
+        if not playback or not playback.get("item"):
+            return None
+
+        item = playback["item"]
+        return {
+            "track_id": item.get("id"),
+            "progress_ms": playback.get("progress_ms") or 0,
+            "duration_ms": item.get("duration_ms") or 0,
+            "is_playing": bool(playback.get("is_playing")),
+        }
 
     def add_to_playlist(self, playlist_id: str, track_id: str) -> None:
         """Adds a track to a playlist."""
@@ -151,6 +193,65 @@ class SpotifyWorker:
         except spotipy.SpotifyException as e:
             print(f"Add Error: {e}")
 
+    def add_tracks_to_playlist(self, playlist_id: str, track_ids: List[str], position: Optional[int] = None) -> str:
+        """
+        Adds tracks in requests of at most 100, at `position` or appended.
+        Returns the playlist's new snapshot_id.
+        """
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        snapshot_id = ""
+        for offset, batch in enumerate(chunked(track_ids, 100)):
+            batch_position = None if position is None else position + offset * 100
+            snapshot_id = self.sp.playlist_add_items(playlist_id, batch, position=batch_position)["snapshot_id"]
+        return snapshot_id
+
+    def remove_playlist_positions(self, playlist_id: str, positions: Dict[str, List[int]], snapshot_id: str) -> str:
+        """
+        Removes specific occurrences of tracks, given as {track ID: [positions]}
+        in the playlist version `snapshot_id`. Returns the new snapshot_id.
+        """
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        items = [{"uri": track_id, "positions": track_positions} for track_id, track_positions in positions.items()]
+        return self.sp.playlist_remove_specific_occurrences_of_items(
+            playlist_id, items, snapshot_id=snapshot_id or None
+        )["snapshot_id"]
+
+    def reorder_playlist(
+        self,
+        playlist_id: str,
+        range_start: int,
+        insert_before: int,
+        snapshot_id: str,
+        range_length: int = 1,
+    ) -> str:
+        """
+        Moves the `range_length` tracks at `range_start` before `insert_before`.
+        Returns the new snapshot_id.
+        """
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        return self.sp.playlist_reorder_items(
+            playlist_id, range_start, insert_before, range_length=range_length, snapshot_id=snapshot_id or None
+        )["snapshot_id"]
+
+    def replace_playlist_tracks(self, playlist_id: str, track_ids: List[str]) -> str:
+        """
+        Replaces a playlist's contents: the first 100 tracks in one request,
+        the rest appended in requests of 100. Returns the new snapshot_id.
+        """
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        snapshot_id = self.sp.playlist_replace_items(playlist_id, track_ids[:100])["snapshot_id"]
+        if len(track_ids) > 100:
+            snapshot_id = self.add_tracks_to_playlist(playlist_id, track_ids[100:])
+        return snapshot_id
+
     def get_liked_songs(self, limit: int = 50) -> Generator[Dict[str, Any], None, None]:
         """Yields liked songs from the user's library."""
         if not self.sp:
@@ -175,3 +276,177 @@ class SpotifyWorker:
             offset += limit
             if results['next'] is None:
                 break
+
+    def _pages(self, fetch: Callable[..., dict], limit: int, **kwargs: Any) -> Generator[Dict[str, Any], None, None]:
+        """Yields the items of every page of an offset-paginated endpoint."""
+        offset = 0
+        while True:
+            response = fetch(limit=limit, offset=offset, **kwargs)
+            items = response.get("items", [])
+            if not items:
+                break
+            yield from items
+            if response.get("next") is None:
+                break
+            offset += limit
+
+    def fetch_playlist_track_ids(self, playlist_id: str) -> List[str]:
+        """Returns the track IDs of a playlist in playlist order."""
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        track_ids: List[str] = []
+        for item in self._pages(self.sp.playlist_items, 100, playlist_id=playlist_id, fields="items.track.id,next"):
+            track = item.get("track") or {}
+            if track.get("id"):
+                track_ids.append(track["id"])
+        return track_ids
+
+    def fetch_album_track_ids(self, album_id: str) -> List[str]:
+        """Returns the track IDs of an album in album order."""
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        return [
+            track["id"]
+            for track in self._pages(self.sp.album_tracks, 50, album_id=album_id)
+            if track.get("id")
+        ]
+
+    def list_playlists(self) -> List[Dict[str, Any]]:
+        """
+        Lists the user's playlists as returned by the list endpoint, which
+        already carries each playlist's name, images, description and snapshot_id.
+        """
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        return [playlist for playlist in self._pages(self.sp.current_user_playlists, 50) if playlist.get("id")]
+
+    def crawl_playlists(self, known_snapshots: Dict[str, str]) -> Tuple[List[str], List[Tuple[Dict[str, Any], List[str]]]]:
+        """
+        Lists the user's playlists and fetches the contents of every playlist
+        whose snapshot_id differs from `known_snapshots`.
+        Returns (all playlist IDs, [(details, track IDs)] for changed playlists).
+        """
+        playlist_ids: List[str] = []
+        changed: List[Tuple[Dict[str, Any], List[str]]] = []
+        for playlist in self.list_playlists():
+            playlist_id = playlist["id"]
+            playlist_ids.append(playlist_id)
+            if known_snapshots.get(playlist_id) == playlist.get("snapshot_id", ""):
+                continue
+            details = {
+                "id": playlist_id,
+                "name": playlist.get("name", ""),
+                "images": playlist.get("images") or [],
+                "description": playlist.get("description") or "",
+                "snapshot_id": playlist.get("snapshot_id", ""),
+            }
+            changed.append((details, self.fetch_playlist_track_ids(playlist_id)))
+        return playlist_ids, changed
+
+    def crawl_saved_albums(self, known_album_ids: Iterable[str]) -> Tuple[List[str], List[Tuple[Dict[str, Any], List[str]]]]:
+        """
+        Lists the user's saved albums and fetches details and track IDs for
+        albums not in `known_album_ids`.
+        Returns (all saved album IDs, [(album, track IDs)] for new albums).
+        """
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        album_ids: List[str] = []
+        for item in self._pages(self.sp.current_user_saved_albums, 50):
+            album = item.get("album") or {}
+            if album.get("id"):
+                album_ids.append(album["id"])
+
+        known = set(known_album_ids)
+        new_albums = [
+            (album, self.fetch_album_track_ids(album["id"]))
+            for album in self.fetch_albums([album_id for album_id in album_ids if album_id not in known])
+        ]
+        return album_ids, new_albums
+
+    @staticmethod
+    def _probe(fetch: Callable[..., dict]) -> str:
+        """Fingerprints a saved-items collection from its first page: total and newest added_at."""
+        page = fetch(limit=1, offset=0)
+        items = page.get("items") or []
+        newest = (items[0].get("added_at") or "") if items else ""
+        return f"{page.get('total', 0)}|{newest}"
+
+    def probe_liked_songs(self) -> str:
+        """One-request fingerprint of the liked songs; it changes whenever a song is liked or unliked."""
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        return self._probe(self.sp.current_user_saved_tracks)
+
+    def probe_saved_albums(self) -> str:
+        """One-request fingerprint of the saved albums."""
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        return self._probe(self.sp.current_user_saved_albums)
+
+    def fetch_liked_track_ids(self) -> List[Tuple[str, str]]:
+        """Returns (track ID, added_at) for every liked song, newest first."""
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        liked: List[Tuple[str, str]] = []
+        for item in self._pages(self.sp.current_user_saved_tracks, 50):
+            track = item.get("track") or {}
+            if track.get("id"):
+                liked.append((track["id"], item.get("added_at") or ""))
+        return liked
+
+    def fetch_tracks(self, track_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """Fetches full track objects in batches of 50."""
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        tracks: List[Dict[str, Any]] = []
+        for batch in chunked(track_ids, 50):
+            tracks.extend(track for track in self.sp.tracks(batch).get("tracks", []) if track and track.get("id"))
+        return tracks
+
+    def fetch_albums(self, album_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """Fetches full album objects in batches of 20."""
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        albums: List[Dict[str, Any]] = []
+        for batch in chunked(album_ids, 20):
+            albums.extend(album for album in self.sp.albums(batch).get("albums", []) if album and album.get("id"))
+        return albums
+
+    def fetch_artists(self, artist_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """Fetches full artist objects in batches of 50."""
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        artists: List[Dict[str, Any]] = []
+        for batch in chunked(artist_ids, 50):
+            artists.extend(artist for artist in self.sp.artists(batch).get("artists", []) if artist and artist.get("id"))
+        return artists
+
+    def fetch_audio_features(self, track_ids: Iterable[str]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        Fetches audio features in batches of 100 as (track ID, features)
+        pairs; features is None for tracks Spotify has no analysis for.
+        Stops early if the endpoint refuses the request.
+        """
+        if not self.sp:
+            raise ConnectionError("Not authenticated.")
+
+        features: List[Tuple[str, Optional[Dict[str, Any]]]] = []
+        for batch in chunked(track_ids, 100):
+            try:
+                results = self.sp.audio_features(batch) or []
+            except spotipy.SpotifyException as e:
+                print(f"Audio Features Error: {e}")
+                break
+            features.extend(zip(batch, results))
+        return features
@@ -0,0 +1,182 @@
+"""Playlist suggestions for the sort session, built from the synced library."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+from typing import Iterable
+
+import numpy as np
+
+from carillon.database_worker import DatabaseWorker
+
+# Feature kinds and how much each contributes to a track's score.
+FEATURE_WEIGHTS = {
+    "artist": 1.0,
+    "album": 0.6,
+    "genre": 0.3,
+}
+
+# Rewritten tracks are appended as new rows and orphan their old ones;
+# once orphans make up this share of all rows the index is rebuilt.
+STALE_ROW_FRACTION = 0.25
+
+
+class _FeatureIndex:
+    """Growable CSR matrix of track rows x feature ids for one feature kind."""
+
+    def __init__(self) -> None:
+        self.vocab: dict[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int64)
+
+    def append_rows(self, rows: list[list[str]]) -> None:
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        ids = [self.vocab.setdefault(name, len(self.vocab)) for row in rows for name in row]
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(lengths)])
+        self.indices = np.concatenate([self.indices, np.asarray(ids, dtype=np.int64)])
+
+    def gather(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (position in `rows`, feature id) pairs for the given track rows."""
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        owners = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return owners, self.indices[np.repeat(starts, lengths) + offsets]
+
+
+class PlaylistSuggester:
+    """
+    Ranks target playlists for unsorted tracks.
+    Keeps an artist/album/genre x playlist co-occurrence matrix per feature
+    kind and scores a track by how often its features already appear in
+    each playlist. refresh() only re-counts playlists whose snapshot_id
+    changed and only indexes tracks written since the previous refresh.
+    """
+
+    def __init__(self, db: DatabaseWorker, playlist_ids: Iterable[str], smoothing: float = 1.0) -> None:
+        self.db = db
+        self.playlist_ids = list(playlist_ids)
+        self.smoothing = smoothing
+        self._features = {kind: _FeatureIndex() for kind in FEATURE_WEIGHTS}
+        self._counts = {kind: np.zeros((0, len(self.playlist_ids))) for kind in FEATURE_WEIGHTS}
+        self._track_rows: dict[str, int] = {}
+        self._stale_rows = 0
+        self._snapshots: dict[str, str] = {}
+        self._members: dict[str, list[str]] = {}
+        self._track_rowid = 0
+        self._artist_rowid = 0
+
+    def _index_tracks(self, full: bool) -> int:
+        """Indexes tracks written since the last call (every track when full); returns how many."""
+        if full:
+            self._features = {kind: _FeatureIndex() for kind in FEATURE_WEIGHTS}
+            self._track_rows.clear()
+            self._stale_rows = 0
+            self._track_rowid = 0
+
+        rows = self.db.tracks_since(self._track_rowid)
+        if not rows:
+            return 0
+        genres = self.db.artist_genres()
+
+        artist_rows = [row[3] for row in rows]
+        self._features["artist"].append_rows(artist_rows)
+        self._features["album"].append_rows([[row[2]] if row[2] else [] for row in rows])
+        self._features["genre"].append_rows(
+            [sorted({genre for artist_id in artists for genre in genres.get(artist_id, ())}) for artists in artist_rows]
+        )
+        first_row = len(self._features["album"].indptr) - 1 - len(rows)
+        for offset, row in enumerate(rows):
+            if self._track_rows.setdefault(row[1], first_row + offset) != first_row + offset:
+                self._track_rows[row[1]] = first_row + offset
+                self._stale_rows += 1
+        self._track_rowid = rows[-1][0]
+        return len(rows)
+
+    def _count_playlist(self, column: int, track_ids: list[str]) -> None:
+        rows = np.fromiter(
+            (self._track_rows[track_id] for track_id in track_ids if track_id in self._track_rows),
+            dtype=np.int64,
+        )
+        for kind, index in self._features.items():
+            _, features = index.gather(rows)
+            self._counts[kind][:, column] = np.bincount(features, minlength=len(index.vocab))
+
+    def refresh(self) -> None:
+        """Brings the matrices up to date with the database."""
+        artist_rowid = self.db.latest_rowid("Artists")
+        # Artist rewrites can change genres of already indexed tracks
+        full = artist_rowid != self._artist_rowid
+        self._artist_rowid = artist_rowid
+        indexed = self._index_tracks(full)
+        if self._stale_rows > STALE_ROW_FRACTION * (len(self._features["album"].indptr) - 1):
+            full = True
+            self._index_tracks(full)
+
+        for kind, index in self._features.items():
+            grow = len(index.vocab) - self._counts[kind].shape[0]
+            if full:
+                self._counts[kind] = np.zeros((len(index.vocab), len(self.playlist_ids)))
+            elif grow:
+                self._counts[kind] = np.vstack([self._counts[kind], np.zeros((grow, len(self.playlist_ids)))])
+
+        # New or rewritten tracks can change the counts of any playlist holding them
+        reindexed = full or indexed > 0
+        for playlist_id, (snapshot_id, track_ids) in self.db.get_playlist_contents(self.playlist_ids).items():
+            if not reindexed and self._snapshots.get(playlist_id) == snapshot_id:
+                continue
+            self._snapshots[playlist_id] = snapshot_id
+            self._members[playlist_id] = track_ids
+            self._count_playlist(self.playlist_ids.index(playlist_id), self._members[playlist_id])
+
+    def score(self, track_ids: Iterable[str]) -> tuple[list[str], np.ndarray]:
+        """
+        Returns (scored track IDs, confidences) where confidences has one
+        row per scored track and one column per target playlist.
+        Tracks the database has no metadata for are left out.
+        """
+        scored = [track_id for track_id in track_ids if track_id in self._track_rows]
+        rows = np.fromiter((self._track_rows[track_id] for track_id in scored), dtype=np.int64, count=len(scored))
+        scores = np.zeros((len(rows), len(self.playlist_ids)))
+        weights = np.zeros(len(rows))
+        for kind, weight in FEATURE_WEIGHTS.items():
+            index = self._features[kind]
+            owners, features = index.gather(rows)
+            if not len(features):
+                continue
+            counts = self._counts[kind]
+            probabilities = counts / (counts.sum(axis=1, keepdims=True) + self.smoothing)
+            contributions = probabilities[features]
+            # owners is sorted, so each track's features are one contiguous segment
+            present, starts, lengths = np.unique(owners, return_index=True, return_counts=True)
+            scores[present] += weight * np.add.reduceat(contributions, starts, axis=0) / lengths[:, None]
+            weights[present] += weight
+        confidences = np.divide(scores, weights[:, None], out=np.zeros_like(scores), where=weights[:, None] > 0)
+        return scored, confidences
+
+    def suggest(self, track_ids: Iterable[str], top: int = 3) -> dict[str, list[tuple[str, float]]]:
+        """Returns the `top` (playlist ID, confidence) pairs for each known track."""
+        scored, confidences = self.score(track_ids)
+        if not scored:
+            return {}
+        order = np.argsort(-confidences, axis=1)[:, :top]
+        return {
+            track_id: [
+                (self.playlist_ids[column], float(confidences[row, column]))
+                for column in order[row]
+                if confidences[row, column] > 0
+            ]
+            for row, track_id in enumerate(scored)
+        }
+
+    def auto_assign(self, track_ids: Iterable[str], threshold: float) -> dict[str, list[str]]:
+        """Groups tracks whose best playlist scores at least `threshold` by that playlist."""
+        scored, confidences = self.score(track_ids)
+        assigned: dict[str, list[str]] = {}
+        if not scored:
+            return assigned
+        best = confidences.argmax(axis=1)
+        for row in np.flatnonzero(confidences[np.arange(len(scored)), best] >= threshold):
+            assigned.setdefault(self.playlist_ids[best[row]], []).append(scored[row])
+        return assigned
@@ -0,0 +1,155 @@
+"""Background sync: cheap change probes on a schedule, full phases only when needed."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+import threading
+import time
+from typing import Callable, Optional
+
+import spotipy
+
+from carillon.database_worker import (
+    DEFAULT_ACCOUNT,
+    DatabaseConfig,
+    DatabaseWorker,
+    SyncChanges,
+)
+from carillon.spotify_worker import SpotifyWorker
+
+# Phases that only fill in metadata for rows the library phases added.
+METADATA_PHASES = ("track_metadata", "album_metadata", "artist_metadata", "audio_features")
+
+DEFAULT_INTERVAL = 300.0
+
+# Access tokens last an hour; refresh well before that.
+REAUTH_SECONDS = 45 * 60
+
+
+class SyncDaemon:
+    """
+    Keeps the database in step with Spotify while other work runs.
+    Every `interval` seconds it lists playlists (whose entries carry
+    snapshot_ids) and reads one item of the liked songs and saved albums,
+    then runs only the sync phases whose probe changed. It owns its own
+    connection, so WAL readers such as a sort session never wait on it,
+    and every write phase commits on its own to keep the write lock short.
+    """
+
+    def __init__(
+        self,
+        config: DatabaseConfig,
+        account_id: str = DEFAULT_ACCOUNT,
+        interval: float = DEFAULT_INTERVAL,
+        on_sync: Optional[Callable[[SyncChanges], None]] = None,
+        quiet: bool = True,
+    ) -> None:
+        self.config = config
+        self.account_id = account_id
+        self.interval = interval
+        self.on_sync = on_sync
+        self.quiet = quiet
+        self.db: Optional[DatabaseWorker] = None
+        self.spotify: Optional[SpotifyWorker] = None
+        self._authenticated_at: Optional[float] = None
+        self._caught_up = False
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _connect(self) -> None:
+        if self.db is None:
+            self.db = DatabaseWorker(self.config)
+            self.db.init()
+            self.spotify = SpotifyWorker(self.db, account_id=self.account_id)
+        if self._authenticated_at is None or time.monotonic() - self._authenticated_at > REAUTH_SECONDS:
+            self.spotify.authenticate()
+            self._authenticated_at = time.monotonic()
+
+    def due_phases(self) -> tuple[list[str], dict[str, str]]:
+        """
+        Probes Spotify and returns (phases to run, probe fingerprints to
+        store once they have run). No phases means nothing changed.
+        """
+        db, spotify = self.db, self.spotify
+        phases: list[str] = []
+
+        listed = {playlist["id"]: playlist.get("snapshot_id", "") for playlist in spotify.list_playlists()}
+        known = db.known_snapshots()
+        if set(listed) != db.account_playlist_ids(self.account_id) or any(
+            known.get(playlist_id) != snapshot_id for playlist_id, snapshot_id in listed.items()
+        ):
+            phases.append("playlists")
+
+        fingerprints: dict[str, str] = {}
+        stored = db.account_library_sizes(self.account_id)
+        for phase, probe in (("albums", spotify.probe_saved_albums), ("liked", spotify.probe_liked_songs)):
+            fingerprint = probe()
+            # Fingerprints are "total|newest added_at"; a non-empty collection with no stored rows always syncs
+            missing = stored[phase] == 0 and not fingerprint.startswith("0|")
+            if missing or fingerprint != db.get_sync_probe(self.account_id, phase):
+                phases.append(phase)
+                fingerprints[phase] = fingerprint
+
+        # The first pass also fills in metadata an interrupted sync left missing
+        if phases or not self._caught_up:
+            phases.extend(METADATA_PHASES)
+        return phases, fingerprints
+
+    def run_once(self) -> SyncChanges:
+        """Probes once and syncs whatever changed; returns the rewritten rows."""
+        self._connect()
+        try:
+            phases, fingerprints = self.due_phases()
+        except spotipy.SpotifyException as e:
+            if e.http_status != 401:
+                raise
+            # Token revoked or expired early; sign in again and retry once
+            self._authenticated_at = None
+            self._connect()
+            phases, fingerprints = self.due_phases()
+
+        changes = SyncChanges()
+        if phases:
+            changes = self.db.sync_from_spotify(self.spotify, phases=phases, quiet=self.quiet)
+            for phase, fingerprint in fingerprints.items():
+                self.db.set_sync_probe(self.account_id, phase, fingerprint)
+        self._caught_up = True
+        return changes
+
+    def run(self) -> None:
+        """Probes and syncs until stop() is called; blocks the calling thread."""
+        try:
+            while not self._stop.is_set():
+                try:
+                    changes = self.run_once()
+                    if self.on_sync is not None:
+                        self.on_sync(changes)
+                except Exception as e:
+                    print(f"[Watch] Sync Error: {e}")
+                self._wake.wait(self.interval)
+                self._wake.clear()
+        finally:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def start(self) -> None:
+        """Runs the probe loop in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="carillon-sync", daemon=True)
+        self._thread.start()
+
+    def sync_now(self) -> None:
+        """Cuts the current wait short."""
+        self._wake.set()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
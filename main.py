@@ -4,22 +4,256 @@ from __future__ import annotations
 
 __author__ = "ChatGPT Codex"
 
+import argparse
+import os
 import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from carillon.database_worker import *
+from carillon.events import EventLoop
+from carillon.multi_sync import MultiAccountSync
+from carillon.profiling import DEFAULT_BUDGET, BudgetExceeded, LibrarySize, ProfileBudget, Profiler, fake_spotify_worker, profile_sync
+from carillon.reconcile import PlaylistReconciler
 from carillon.spotify_worker import SpotifyWorker
+from carillon.sync_daemon import DEFAULT_INTERVAL, SyncDaemon
+from carillon.suggestions import PlaylistSuggester
 from embed_term import readchar
 
-def main() -> None:
+DEFAULT_DB_PATH = 'C:\\Users\\servi\\AppData\\Roaming\\SpotifyPlaylistManager\\data.db'
+
+# Playback checks: first one shortly after starting a song, then at the
+# expected end of the track but never further apart than PLAYBACK_MAX_WAIT.
+PLAYBACK_CHECK_SECONDS = 3.0
+PLAYBACK_MAX_WAIT = 30.0
+
+# Background flush size: one full add request.
+FLUSH_BATCH = 100
+
+# Playlists the sort session files songs into, in key order.
+TARGET_PLAYLIST_IDS = [
+    "65392yUXSa7CibP88Sn08A",
+    "1ARRU77hkx4OTyw9bXdddx",
+    "6eNBczFcPGUHmJgIcJht3n",
+    "14vSWI3bnHGdHwZzYvQFAA",
+    "7B6PFPO2coL4eHBZV5ERzo",
+    "23svSBQEKD9JLSGiBu6x11",
+    "6obxnggDmfxDBD0PyR83qq",
+    "5qpWnHFhrdZJFasqvUkYnL",
+    "79NBBzBTMmTnxS52yF6sQS",
+    "1P6uaRXoH3oUGKZlG57OTB",
+    "252nMBfkL56QMavLz0Pz5Q",
+]
+
+# Key Mapping: ~ (tilde/backtick), then 1-9, then 0.
+PLAYLIST_KEYS = ['`', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0']
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Carillon playlist sorter.")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to the shared data.db.")
+    commands = parser.add_subparsers(dest="command")
+
+    sort_cmd = commands.add_parser("sort", help="Run the interactive sort session (default).")
+    sort_cmd.add_argument(
+        "--auto-assign",
+        type=float,
+        default=None,
+        metavar="CONFIDENCE",
+        help="Queue tracks whose best suggestion reaches this confidence (0-1) without playing them.",
+    )
+    sort_cmd.add_argument(
+        "--order",
+        choices=sorted(AUDIO_FEATURES),
+        default=None,
+        help="Play songs ordered by a stored audio feature instead of shuffled.",
+    )
+    sort_cmd.add_argument("--descending", action="store_true", help="Reverse --order.")
+    sort_cmd.add_argument(
+        "--artist",
+        action="append",
+        default=[],
+        metavar="NAME_OR_ID",
+        help="Only sort liked songs by this artist (repeatable).",
+    )
+    sort_cmd.add_argument(
+        "--genre",
+        action="append",
+        default=[],
+        help="Only sort liked songs by artists in this genre (repeatable).",
+    )
+    sort_cmd.add_argument(
+        "--watch",
+        type=float,
+        nargs="?",
+        const=DEFAULT_INTERVAL,
+        default=None,
+        metavar="SECONDS",
+        help="Keep syncing from Spotify in the background while sorting.",
+    )
+    sort_cmd.add_argument(
+        "--preview",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Move on to the next song after this many seconds.",
+    )
+
+    export_cmd = commands.add_parser("export", help="Write the library to a compressed NDJSON dump.")
+    export_cmd.add_argument("path", help="Destination file, e.g. library.ndjson.gz")
+
+    import_cmd = commands.add_parser("import", help="Replace the library with a dump from export.")
+    import_cmd.add_argument("path", help="Dump file written by export.")
+
+    sync_cmd = commands.add_parser("sync", help="Sync the library from Spotify.")
+    sync_cmd.add_argument(
+        "--accounts",
+        nargs="*",
+        help="Sync these accounts in parallel; with no IDs, every registered account (or the default one).",
+    )
+    sync_cmd.add_argument("--processes", type=int, default=None, help="Worker processes (default: CPU count).")
+
+    watch_cmd = commands.add_parser("watch", help="Sync from Spotify whenever the library changes.")
+    watch_cmd.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between change probes.")
+    watch_cmd.add_argument("--account", default=DEFAULT_ACCOUNT, help="Account to watch.")
+
+    reconcile_cmd = commands.add_parser("reconcile", help="Make a playlist match a list of tracks.")
+    reconcile_cmd.add_argument("playlist_id")
+    reconcile_cmd.add_argument("tracks_file", help="One track ID, URI or URL per line, in the desired order.")
+    reconcile_cmd.add_argument("--dry-run", action="store_true", help="Print the plan without applying it.")
+
+    stats_cmd = commands.add_parser("stats", help="Print library statistics.")
+    stats_cmd.add_argument("--limit", type=int, default=10, help="Rows per section.")
+    stats_cmd.add_argument(
+        "--artists-by",
+        choices=sorted(STATS_ORDER),
+        default="unsorted",
+        help="Order the artist section by this count.",
+    )
+    stats_cmd.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Rebuild artist and genre relations and recount everything before reporting.",
+    )
+    stats_cmd.add_argument("--account", default=DEFAULT_ACCOUNT, help="Account whose liked songs are counted.")
+
+    profile_cmd = commands.add_parser(
+        "profile",
+        help="Profile sync and sort setup against a synthetic library; does not touch --db or Spotify.",
+    )
+    profile_cmd.add_argument("--output", default="profile-out", help="Directory for .pstats and allocation reports.")
+    profile_cmd.add_argument("--tracks", type=int, default=LibrarySize.tracks)
+    profile_cmd.add_argument("--artists", type=int, default=LibrarySize.artists)
+    profile_cmd.add_argument("--albums", type=int, default=LibrarySize.albums)
+    profile_cmd.add_argument("--playlists", type=int, default=LibrarySize.playlists)
+    # Defaults fit the default library shape; pass 0 to turn a check off.
+    profile_cmd.add_argument(
+        "--max-rss-mb",
+        type=float,
+        default=DEFAULT_BUDGET.max_rss_mb,
+        help="Fail if the process's peak RSS exceeds this (default: %(default)s).",
+    )
+    profile_cmd.add_argument(
+        "--max-calls-per-track",
+        type=float,
+        default=DEFAULT_BUDGET.max_calls_per_track,
+        help="Fail if API requests per synced track exceed this (default: %(default)s).",
+    )
+    profile_cmd.add_argument(
+        "--max-phase-peak-mb",
+        type=float,
+        default=DEFAULT_BUDGET.max_phase_peak_mb,
+        help="Fail if any phase's traced allocations peak above this (default: %(default)s).",
+    )
+
+    account_cmd = commands.add_parser("add-account", help="Register an account and sign in to it.")
+    account_cmd.add_argument("account_id")
+    account_cmd.add_argument("--client-id", required=True)
+    account_cmd.add_argument("--client-secret", required=True)
+    account_cmd.add_argument("--name", default="", help="Display name.")
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.command == "profile":
+        size = LibrarySize(tracks=args.tracks, artists=args.artists, albums=args.albums, playlists=args.playlists)
+        budget = ProfileBudget(
+            max_rss_mb=args.max_rss_mb or None,
+            max_calls_per_track=args.max_calls_per_track or None,
+            max_phase_peak_mb=args.max_phase_peak_mb or None,
+        )
+        try:
+            profile(args.output, size, budget)
+        except BudgetExceeded as e:
+            print(f"[Profile] {e}")
+            raise SystemExit(1)
+        return
+
     API = {
-    "db": DatabaseWorker(config=DatabaseConfig(db_filename='C:\\Users\\servi\\AppData\\Roaming\\SpotifyPlaylistManager\\data.db'))}
+    "db": DatabaseWorker(config=DatabaseConfig(db_filename=args.db))}
     API["db"].init()
     print(f"Using database: {API['db'].db_path}")
 
+    if args.command == "export":
+        counts = API["db"].export_dump(args.path)
+        for table, count in counts.items():
+            print(f"  [Export] {table}: {count} rows")
+        print(f"Wrote {args.path}")
+        return
+
+    if args.command == "import":
+        counts = API["db"].import_dump(args.path)
+        for table, count in counts.items():
+            print(f"  [Import] {table}: {count} rows")
+        print(f"Loaded {args.path}")
+        return
+
+    if args.command == "stats":
+        if args.refresh:
+            API["db"].rebuild_relations()
+        print_stats(API["db"], limit=args.limit, artists_by=args.artists_by, account_id=args.account)
+        return
+
+    if args.command == "add-account":
+        API["db"].add_account(args.account_id, args.name)
+        API["db"].set_account_setting(args.account_id, SpotifyWorker.KEY_CLIENT_ID, args.client_id)
+        API["db"].set_account_setting(args.account_id, SpotifyWorker.KEY_CLIENT_SECRET, args.client_secret)
+        SpotifyWorker(API["db"], account_id=args.account_id).authenticate()
+        return
+
+    if args.command == "sync" and args.accounts is not None:
+        accounts = args.accounts or API["db"].list_accounts()
+        if not accounts:
+            print(f"[Sync] No accounts registered; syncing the '{DEFAULT_ACCOUNT}' account.")
+            accounts = [DEFAULT_ACCOUNT]
+        MultiAccountSync(API["db"], accounts, processes=args.processes).run()
+        return
+
+    if args.command == "watch":
+        watch(API, interval=args.interval, account_id=args.account)
+        return
+
     API["spotify"] = SpotifyWorker(API["db"])
     API["spotify"].authenticate()
+    if args.command == "sync":
+        db_sync(API)
+        return
+    if args.command == "reconcile":
+        reconcile(API, args.playlist_id, args.tracks_file, dry_run=args.dry_run)
+        return
     readchar.init()
-    script(API)
+    script(
+        API,
+        auto_assign=getattr(args, "auto_assign", None),
+        order=getattr(args, "order", None),
+        descending=getattr(args, "descending", False),
+        preview=getattr(args, "preview", None),
+        artists=getattr(args, "artist", []),
+        genres=getattr(args, "genre", []),
+        watch_interval=getattr(args, "watch", None),
+    )
     readchar.reset()
 def db_sync(API: dict) -> None:
     """
@@ -31,75 +265,125 @@ def db_sync(API: dict) -> None:
     db.sync_from_spotify(spotify)
 
 
-def script(API: dict) -> None:
-    """
-    Main sorting loop.
-    - Maps keys ~ through 0 to the provided playlists.
-    - Writes to DB immediately.
-    - Batches Spotify updates until Quit (q).
-    - Shuffles songs before playing.
-    """
-    db: DatabaseWorker = API["db"]
-    spotify: SpotifyWorker = API["spotify"]
-
-    # 1. Configuration
-    # ID List provided by user
-    target_playlist_ids = [
-        "65392yUXSa7CibP88Sn08A",
-        "1ARRU77hkx4OTyw9bXdddx",
-        "6eNBczFcPGUHmJgIcJht3n",
-        "14vSWI3bnHGdHwZzYvQFAA",
-        "7B6PFPO2coL4eHBZV5ERzo",
-        "23svSBQEKD9JLSGiBu6x11",
-        "6obxnggDmfxDBD0PyR83qq",
-        "5qpWnHFhrdZJFasqvUkYnL",
-        "79NBBzBTMmTnxS52yF6sQS",
-        "1P6uaRXoH3oUGKZlG57OTB",
-        "252nMBfkL56QMavLz0Pz5Q"
-    ]
-
-    # Key Mapping: ~ (tilde/backtick), then 1-9, then 0.
-    keys = ['`', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0']
-    
-    # Also support actual '~' just in case
-    key_aliases = {'~': '`'}
-
-    playlist_map: Dict[str, Dict[str, str]] = {}
-    spotify_queue: Dict[str, List[str]] = {} # Batching: { playlist_id: [track_ids] }
+def describe_changes(changes: SyncChanges) -> str:
+    return ", ".join(
+        f"{len(ids)} {kind}s" for kind, ids in [*changes.touched.items(), ("liked song", changes.liked)] if ids
+    )
 
-    def fetch_playlist_track_ids(playlist_id: str) -> Set[str]:
-        track_ids: Set[str] = set()
-        offset = 0
-        limit = 100
 
-        while True:
-            response = spotify.sp.playlist_items(
-                playlist_id,
-                fields="items(track(id)),next",
-                offset=offset,
-                limit=limit,
-            )
-            for item in response.get("items", []):
-                track = item.get("track")
-                if track and track.get("id"):
-                    track_ids.add(track["id"])
-
-            if not response.get("next"):
-                break
-            offset += limit
+def watch(API: dict, interval: float = DEFAULT_INTERVAL, account_id: str = DEFAULT_ACCOUNT) -> None:
+    """Probes Spotify every `interval` seconds and syncs what changed, until Ctrl+C."""
+    def report(changes: SyncChanges) -> None:
+        if changes:
+            print(f"[Watch] Synced {describe_changes(changes)}.")
 
-        return track_ids
+    daemon = SyncDaemon(API["db"].config, account_id=account_id, interval=interval, on_sync=report, quiet=False)
+    print(f"[Watch] Probing every {interval:g}s. Ctrl+C to stop.")
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        print("\n[Watch] Stopped.")
 
-    print("\n[Init] Loading Playlist Names...")
-    
-    # 2. Build Lookup Table
-    for index, pid in enumerate(target_playlist_ids):
-        if index >= len(keys):
-            break
-        
-        key_char = keys[index]
-        spotify_queue[pid] = [] # Init queue for this playlist
 
+def profile(output: str, size: LibrarySize, budget: ProfileBudget) -> None:
+    """
+    Syncs a synthetic library into a scratch database under `output`, then
+    runs the sort session's setup phases against it, profiling each phase.
+    Raises BudgetExceeded if the run goes over `budget`.
+    """
+    os.makedirs(output, exist_ok=True)
+    db_path = os.path.abspath(os.path.join(output, "profile.db"))
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    db = DatabaseWorker(config=DatabaseConfig(db_filename=db_path))
+    db.init()
+    spotify = fake_spotify_worker(db, size)
+    profiler = Profiler(output, api=spotify.sp)
+
+    print(f"[Profile] Syncing {size.tracks} tracks, {size.playlists} playlists...")
+    track_count = profile_sync(db, spotify, profiler)
+
+    target_playlist_ids = list(spotify.sp.playlists)[:len(PLAYLIST_KEYS)]
+    with profiler.phase("script/playlist_map"):
+        load_playlist_map(spotify, target_playlist_ids)
+    with profiler.phase("script/library_stats"):
+        db.library_stats(spotify.account_id)
+    with profiler.phase("script/playlist_tracks"):
+        playlist_track_ids = load_playlist_track_ids(spotify, target_playlist_ids)
+    with profiler.phase("script/songs"):
+        all_songs = load_songs(db, spotify, order="energy")
+    with profiler.phase("script/suggestions"):
+        suggester = build_suggester(db, target_playlist_ids)
+        suggester.auto_assign([song['id'] for song in all_songs if song['id'] not in playlist_track_ids], 0.5)
+    db.close()
+
+    print(f"\n[Profile] {track_count} tracks synced; reports in {output}")
+    for line in profiler.summary():
+        print(f"  {line}")
+    profiler.check(budget, track_count)
+
+
+def format_duration(duration_ms: int) -> str:
+    minutes, seconds = divmod(duration_ms // 1000, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def print_stats(
+    db: DatabaseWorker,
+    limit: int = 10,
+    artists_by: str = "unsorted",
+    account_id: str = DEFAULT_ACCOUNT,
+) -> None:
+    """Prints the library summary tables, with liked and unsorted counts for one account."""
+    totals = db.library_stats(account_id)
+    print(f"\n[Stats] {totals.get('tracks', 0)} tracks ({format_duration(totals.get('duration_ms', 0))}), "
+          f"{totals.get('albums', 0)} albums, {totals.get('artists', 0)} artists, "
+          f"{totals.get('genres', 0)} genres, {totals.get('playlists', 0)} playlists")
+    print(f"[Stats] {totals.get('liked', 0)} liked songs, {totals.get('unsorted', 0)} in no playlist")
+
+    print("\n[Playlists] tracks / unique / duration")
+    for row in db.playlist_stats(limit=limit):
+        print(f"  {row['tracks']:6d} {row['unique_tracks']:6d} {format_duration(row['duration_ms']):>10}  {row['name'] or row['id']}")
+
+    print(f"\n[Artists] tracks / liked / unsorted, by {artists_by}")
+    for row in db.artist_stats(order_by=artists_by, limit=limit, account_id=account_id):
+        print(f"  {row['tracks']:6d} {row['liked']:6d} {row['unsorted']:6d}  {row['name'] or row['id']}")
+
+    print("\n[Genres] tracks / duration")
+    for row in db.genre_stats(order_by="duration", limit=limit, account_id=account_id):
+        print(f"  {row['tracks']:6d} {format_duration(row['duration_ms']):>10}  {row['genre']}")
+
+    print("\n[Overlap] shared tracks")
+    for row in db.playlist_overlap(limit=limit):
+        print(f"  {row['shared']:6d}  {row['a_name'] or row['a']} <> {row['b_name'] or row['b']}")
+
+
+def reconcile(API: dict, playlist_id: str, tracks_file: str, dry_run: bool = False) -> None:
+    """Brings one playlist in line with the track list in `tracks_file`."""
+    with open(tracks_file, encoding="utf-8") as handle:
+        # Accept bare IDs, spotify:track:ID URIs and open.spotify.com URLs
+        desired = [
+            line.strip().split("?")[0].replace(":", "/").rsplit("/", 1)[-1]
+            for line in handle
+            if line.strip() and not line.startswith("#")
+        ]
+
+    reconciler = PlaylistReconciler(API["db"], API["spotify"])
+    plan = reconciler.plan(playlist_id, desired) if dry_run else reconciler.apply(playlist_id, desired)
+    if plan.replacement is not None:
+        summary = f"rewrite of {len(plan.replacement)} tracks"
+    else:
+        summary = (f"{len(plan.removals)} removals, {len(plan.moves)} moves, "
+                   f"{sum(len(track_ids) for _, track_ids in plan.insertions)} additions")
+    print(f"[Reconcile] {playlist_id}: {summary} in {plan.request_count} requests{' (dry run)' if dry_run else ''}.")
+
+
+def load_playlist_map(spotify: SpotifyWorker, playlist_ids: List[str]) -> Dict[str, Dict[str, str]]:
+    """Maps each key to {'id', 'name'} of the target playlist it files into."""
+    playlist_map: Dict[str, Dict[str, str]] = {}
+    for key_char, pid in zip(PLAYLIST_KEYS, playlist_ids):
         # Try to get name from DB or Spotify
         try:
             # Fetch name (Cached or Live)
@@ -107,94 +391,370 @@ def script(API: dict) -> None:
             name = pl['name']
         except Exception:
             name = "Unknown Playlist"
-        
+
         playlist_map[key_char] = {"id": pid, "name": name}
         print(f"  [{key_char}] -> {name}")
+    return playlist_map
 
-    print("\n[Controls] Space: Skip | q: Save & Quit")
 
-    # 3. Load processed tracks to skip
-    processed_tracks: Set[str] = set()
-    playlist_track_ids: Set[str] = set()
-
-    print("\n[Init] Loading existing playlist tracks to skip...")
-    for pid in target_playlist_ids:
+def load_playlist_track_ids(spotify: SpotifyWorker, playlist_ids: List[str]) -> Set[str]:
+    """Returns every track already in one of the playlists."""
+    track_ids: Set[str] = set()
+    for pid in playlist_ids:
+        offset = 0
+        limit = 100
         try:
-            playlist_track_ids.update(fetch_playlist_track_ids(pid))
+            while True:
+                response = spotify.sp.playlist_items(
+                    pid,
+                    fields="items(track(id)),next",
+                    offset=offset,
+                    limit=limit,
+                )
+                for item in response.get("items", []):
+                    track = item.get("track")
+                    if track and track.get("id"):
+                        track_ids.add(track["id"])
+
+                if not response.get("next"):
+                    break
+                offset += limit
         except Exception as e:
             print(f"[Error] Fetching tracks for {pid}: {e}")
+    return track_ids
+
 
-    print("\n[Stream] Fetching ALL songs to shuffle (this might take a moment)...")
+def load_songs(
+    db: DatabaseWorker,
+    spotify: SpotifyWorker,
+    artists: Optional[List[str]] = None,
+    genres: Optional[List[str]] = None,
+    order: Optional[str] = None,
+    descending: bool = False,
+) -> Optional[List[Dict[str, str]]]:
+    """
+    Returns the liked songs to sort, shuffled or ordered by an audio feature;
+    None when an artist filter matches no synced artist.
+    """
     all_songs = []
-    try:
-        for song in spotify.get_liked_songs(limit=50):
-            all_songs.append(song)
-    except Exception as e:
-        print(f"[Error] Fetching songs: {e}")
+    if artists or genres:
+        artist_ids = db.find_artist_ids(artists or [])
+        if artists and not artist_ids:
+            print(f"[Error] No synced artist matches {', '.join(artists)}.")
+            return None
+        all_songs = db.sort_queue(artist_ids=artist_ids, genres=genres or [], liked=True, account_id=spotify.account_id)
+        print(f"\n[Stream] {len(all_songs)} liked songs match the filters.")
+    else:
+        print("\n[Stream] Fetching ALL songs to shuffle (this might take a moment)...")
+        try:
+            for song in spotify.get_liked_songs(limit=50):
+                all_songs.append(song)
+        except Exception as e:
+            print(f"[Error] Fetching songs: {e}")
 
     # SHUFFLE
     random.shuffle(all_songs)
     print(f"[Stream] Shuffled {len(all_songs)} songs.")
 
+    if order:
+        # Stable sort keeps songs without stored features shuffled at the end
+        track_ids, values = db.load_audio_features([order])
+        feature_values = dict(zip(track_ids, values[:, 0]))
+        sign = -1 if descending else 1
+        all_songs.sort(key=lambda song: (song['id'] not in feature_values, sign * feature_values.get(song['id'], 0.0)))
+        print(f"[Stream] Ordered by {order}; {sum(song['id'] in feature_values for song in all_songs)} songs have it.")
+    return all_songs
+
+
+def build_suggester(db: DatabaseWorker, playlist_ids: List[str]) -> PlaylistSuggester:
+    suggester = PlaylistSuggester(db, playlist_ids)
+    suggester.refresh()
+    return suggester
+
+
+def script(
+    API: dict,
+    auto_assign: Optional[float] = None,
+    order: Optional[str] = None,
+    descending: bool = False,
+    preview: Optional[float] = None,
+    artists: Optional[List[str]] = None,
+    genres: Optional[List[str]] = None,
+    watch_interval: Optional[float] = None,
+) -> None:
+    """
+    Main sorting loop.
+    - Maps keys ~ through 0 to the provided playlists.
+    - Writes to DB immediately.
+    - Batches Spotify updates, sending full batches in the background
+      and the rest on Quit (q).
+    - Waits on keys, playback progress and flush results without polling;
+      advances when a song ends or after `preview` seconds.
+    - Shuffles songs before playing, or orders them by an audio feature.
+    - Suggests likely playlists from the synced library; with auto_assign,
+      queues confident suggestions up front.
+    - With artists or genres, sorts only the matching liked songs from the
+      synced library instead of every liked song on Spotify.
+    - With watch_interval, syncs in the background and refreshes
+      suggestions whenever the library changed.
+    """
+    db: DatabaseWorker = API["db"]
+    spotify: SpotifyWorker = API["spotify"]
+
+    # Key Mapping: ~ (tilde/backtick), then 1-9, then 0.
+    keys = PLAYLIST_KEYS
+    target_playlist_ids = TARGET_PLAYLIST_IDS
+
+    # Also support actual '~' just in case
+    key_aliases = {'~': '`'}
+
+    print("\n[Init] Loading Playlist Names...")
+    playlist_map = load_playlist_map(spotify, target_playlist_ids)
+    spotify_queue: Dict[str, List[str]] = {entry["id"]: [] for entry in playlist_map.values()} # Batching: { playlist_id: [track_ids] }
+
+    print("\n[Controls] Space: Skip | /: Search & queue | q: Save & Quit")
+
+    totals = db.library_stats(spotify.account_id)
+    unsorted_total = totals.get("unsorted", 0)
+    print(f"\n[Stats] {unsorted_total} of {totals.get('liked', 0)} liked songs are in no playlist.")
+
+    # 3. Load processed tracks to skip
+    processed_tracks: Set[str] = set()
+    print("\n[Init] Loading existing playlist tracks to skip...")
+    playlist_track_ids = load_playlist_track_ids(spotify, target_playlist_ids)
+
+    all_songs = load_songs(db, spotify, artists=artists, genres=genres, order=order, descending=descending)
+    if all_songs is None:
+        return
+    queue = deque(all_songs)
+
+    print("\n[Init] Building playlist suggestions...")
+    suggester = build_suggester(db, target_playlist_ids)
+    playlist_keys = {entry["id"]: key_char for key_char, entry in playlist_map.items()}
+
+    if auto_assign is not None:
+        unsorted_ids = [song['id'] for song in all_songs if song['id'] not in playlist_track_ids]
+        for pid, track_ids in suggester.auto_assign(unsorted_ids, auto_assign).items():
+            if pid not in playlist_keys:
+                continue
+            spotify_queue[pid].extend(track_ids)
+            processed_tracks.update(track_ids)
+            print(f"  [Auto] {len(track_ids)} tracks -> {playlist_map[playlist_keys[pid]]['name']}")
+
+    loop = EventLoop(readchar.readchar)
+    daemon: Optional[SyncDaemon] = None
+    if watch_interval:
+        daemon = SyncDaemon(db.config, account_id=spotify.account_id, interval=watch_interval,
+                            on_sync=lambda changes: loop.post("sync", changes))
+        daemon.start()
+    # A playlist's batch is sent in the background once it reaches the API limit
+    flush_pool = ThreadPoolExecutor(max_workers=1)
+
+    def playlist_name(pid: str) -> str:
+        return playlist_map.get(keys[target_playlist_ids.index(pid)], {}).get('name', pid)
+
+    def add_tracks(pid: str, tracks: List[str]) -> None:
+        spotify.add_tracks_to_playlist(pid, tracks)
+
+    def flush_in_background(pid: str) -> None:
+        tracks = spotify_queue[pid]
+        spotify_queue[pid] = []
+        future = flush_pool.submit(add_tracks, pid, tracks)
+        future.add_done_callback(lambda done: loop.post("flush", (pid, tracks, done.exception())))
+
+    def report_flush(payload) -> None:
+        pid, tracks, error = payload
+        if error is None:
+            print(f"  [Flush] Added {len(tracks)} tracks to {playlist_name(pid)}")
+        else:
+            # Put them back so the final flush retries
+            print(f"  [Error] Background add to {pid} failed: {error}")
+            spotify_queue[pid][:0] = tracks
+
+    def read_line(prompt: str) -> Optional[str]:
+        """Reads a line key by key; Esc cancels."""
+        print(prompt, end="", flush=True)
+        chars: List[str] = []
+        while True:
+            key = loop.next_key()
+            if key in ("\r", "\n"):
+                print()
+                return "".join(chars)
+            if key == "\x1b":
+                print()
+                return None
+            if key in ("\x7f", "\x08"):
+                if chars:
+                    chars.pop()
+                    print("\b \b", end="", flush=True)
+                continue
+            if key.isprintable():
+                chars.append(key)
+                print(key, end="", flush=True)
+
+    def search_and_queue() -> None:
+        """Searches the local library and puts the chosen track up next."""
+        query = read_line("  [Search] ")
+        if not query:
+            return
+        results = db.search(query, kinds=["track"], limit=9)
+        if not results:
+            print("  [Search] No matches.")
+            return
+        for number, result in enumerate(results, start=1):
+            print(f"    {number}) {result['name']} - {result['context']}")
+        print("  [Search] 1-9: Play next | any other key: Cancel")
+        key = loop.next_key()
+        if key.isdigit() and 1 <= int(key) <= len(results):
+            result = results[int(key) - 1]
+            queue.appendleft({
+                "id": result["id"],
+                "name": result["name"],
+                "artists": result["context"],
+                "queued": True,
+            })
+            print(f"  [Search] Up next: {result['name']}")
+
+    def save_and_quit() -> None:
+        print("\n[Quit] Processing batch queue...")
+        flush_pool.shutdown(wait=True)
+        for kind, payload in loop.drain():
+            if kind == "flush":
+                report_flush(payload)
+
+        # Flush to Spotify
+        for pid, tracks in spotify_queue.items():
+            if tracks:
+                print(f"  -> Adding {len(tracks)} tracks to {playlist_name(pid)}...")
+                try:
+                    add_tracks(pid, tracks)
+                except Exception as e:
+                    print(f"  [Error] Failed to add to {pid}: {e}")
+
+        print("All changes saved. Exiting.")
+
+    def handle_key(song: Dict[str, str], key: str) -> Optional[str]:
+        """Returns 'next' or 'quit' when the key ends this song."""
+        # Handle Alias (e.g. shift+` = ~)
+        key = key_aliases.get(key, key)
+
+        if key == 'q':
+            return "quit"
+
+        if key == ' ':
+            print("  [Skip]")
+            return "next"
+
+        if key == '/':
+            search_and_queue()
+            return None
+
+        if key in playlist_map:
+            target = playlist_map[key]
+            print(f"  [Queue] Adding to '{target['name']}'")
+
+            # 1. Write to DB Immediately (Mock implementation)
+            # db.record_sort(song['id'], target['id'])
+            processed_tracks.add(song['id'])
+
+            # 2. Batch for Spotify (Write later)
+            spotify_queue[target['id']].append(song['id'])
+            if len(spotify_queue[target['id']]) >= FLUSH_BATCH:
+                flush_in_background(target['id'])
+
+            return "next"
+
+        return None
+
+    def check_playback(song: Dict[str, str], seen_playing: bool) -> tuple[bool, Optional[float]]:
+        """
+        Returns (seen_playing, seconds until the next check); None means
+        the song has finished.
+        """
+        progress = spotify.get_playback_progress()
+        if progress is None or progress["track_id"] != song['id']:
+            # Before we have seen it play, assume the device has not caught up yet
+            return seen_playing, None if seen_playing else PLAYBACK_CHECK_SECONDS
+        if progress["is_playing"]:
+            remaining = max(progress["duration_ms"] - progress["progress_ms"], 0) / 1000
+            return True, min(remaining + 0.5, PLAYBACK_MAX_WAIT)
+        if seen_playing and progress["progress_ms"] == 0:
+            return seen_playing, None
+        return seen_playing, PLAYBACK_MAX_WAIT
+
+    aborted = False
     try:
         spotify.set_shuffle(False)
-        # Loop through SHUFFLED songs
-        for song in all_songs:
+        # Loop through SHUFFLED songs, plus anything queued from search
+        while queue:
+            song = queue.popleft()
             if not spotify.has_active_playback():
                 print("[Error] No active playback device. Start Spotify on a device and try again.")
-                return
+                break
 
-            if song['id'] in processed_tracks or song['id'] in playlist_track_ids:
+            if not song.get("queued") and (song['id'] in processed_tracks or song['id'] in playlist_track_ids):
                 continue
 
-            print(f"\n>> PLAYING: {song['name']} - {song['artists']}")
+            print(f"\n>> PLAYING ({max(unsorted_total - len(processed_tracks), 0)} unsorted left): "
+                  f"{song['name']} - {song['artists']}")
             spotify.play_track(song['id'])
 
-            # Input Loop
-            while True:
-                # User specified readchar.readchar()
-                key = readchar.readchar()
-                
-                if key is None:
-                    continue
-                
-                # Handle Alias (e.g. shift+` = ~)
-                key = key_aliases.get(key, key)
-
-                if key == 'q':
-                    print("\n[Quit] Processing batch queue...")
-                    
-                    # Flush to Spotify
-                    for pid, tracks in spotify_queue.items():
-                        if tracks:
-                            print(f"  -> Adding {len(tracks)} tracks to {playlist_map.get(keys[target_playlist_ids.index(pid)], {}).get('name', pid)}...")
-                            try:
-                                spotify.sp.playlist_add_items(pid, tracks)
-                            except Exception as e:
-                                print(f"  [Error] Failed to add to {pid}: {e}")
-                    
-                    print("All changes saved. Exiting.")
-                    return
-
-                if key == ' ':
-                    print("  [Skip]")
-                    break # Break input loop, next song
-
-                if key in playlist_map:
-                    target = playlist_map[key]
-                    print(f"  [Queue] Adding to '{target['name']}'")
-                    
-                    # 1. Write to DB Immediately (Mock implementation)
-                    # db.record_sort(song['id'], target['id'])
-                    processed_tracks.add(song['id'])
-
-                    # 2. Batch for Spotify (Write later)
-                    spotify_queue[target['id']].append(song['id'])
-                    
-                    break # Break input loop, next song
+            suggestions = suggester.suggest([song['id']]).get(song['id'], [])
+            if suggestions:
+                print("  [Suggest] " + " | ".join(
+                    f"[{playlist_keys[pid]}] {playlist_map[playlist_keys[pid]]['name']} {confidence:.0%}"
+                    for pid, confidence in suggestions
+                    if pid in playlist_keys
+                ))
+
+            # Input Loop: sleeps until a key, a playback check or a flush result
+            timers = [loop.call_later(PLAYBACK_CHECK_SECONDS, "playback", song['id'])]
+            if preview:
+                timers.append(loop.call_later(preview, "preview", song['id']))
+            seen_playing = False
+            action = None
+            while action is None:
+                kind, payload = loop.next_event()
+
+                if kind == "key":
+                    action = handle_key(song, payload)
+                elif kind == "flush":
+                    report_flush(payload)
+                elif kind == "sync" and payload:
+                    suggester.refresh()
+                    print(f"  [Watch] Library updated: {describe_changes(payload)}")
+                elif kind == "preview" and payload == song['id']:
+                    print("  [Preview] Time's up")
+                    action = "next"
+                elif kind == "playback" and payload == song['id']:
+                    seen_playing, delay = check_playback(song, seen_playing)
+                    if delay is None:
+                        print("  [End] Track finished")
+                        action = "next"
+                    else:
+                        timers.append(loop.call_later(delay, "playback", song['id']))
+
+            for timer in timers:
+                loop.cancel(timer)
+
+            if action == "quit":
+                break
 
     except KeyboardInterrupt:
-        print("\n[Force Exit] No changes saved to Spotify.")
+        # Ctrl+C aborts: batches already flushed stay, nothing else is sent
+        aborted = True
+        pending = sum(len(tracks) for tracks in spotify_queue.values())
+        print(f"\n[Force Exit] {pending} queued sorts not saved to Spotify.")
+    finally:
+        # Every other way out, including errors, sends what is still queued
+        try:
+            if not aborted:
+                save_and_quit()
+        finally:
+            if daemon is not None:
+                daemon.stop(timeout=5.0)
+            flush_pool.shutdown(wait=False)
+            loop.close()
 
 if __name__ == "__main__":
     main()
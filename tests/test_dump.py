@@ -0,0 +1,48 @@
+"""Round-trips a library through export_dump and import_dump."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+import os
+import tempfile
+import unittest
+
+from carillon.database_worker import DatabaseConfig, DatabaseWorker, SyncChanges
+
+
+class DumpTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dump_path = os.path.join(self.tmp.name, "library.ndjson.gz")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def open_db(self, name: str) -> DatabaseWorker:
+        db = DatabaseWorker(config=DatabaseConfig(db_filename=os.path.join(self.tmp.name, name)))
+        db.init()
+        self.addCleanup(db.close)
+        return db
+
+    def test_audio_features_move_with_the_library(self) -> None:
+        source = self.open_db("source.db")
+        changes = SyncChanges()
+        source.write_catalog("track", [{"id": "t1", "name": "One", "artists": [], "album": {"id": "al1"}}], changes)
+        source.write_catalog("audio_feature", [("t1", {"energy": 0.5, "tempo": 120.0}), ("t2", None)], changes)
+        source.finish_sync(changes, quiet=True)
+        source.export_dump(self.dump_path)
+
+        target = self.open_db("target.db")
+        target.write_catalog("audio_feature", [("stale", {"energy": 0.1})], SyncChanges())
+        counts = target.import_dump(self.dump_path)
+
+        self.assertEqual(counts["AudioFeatures"], 2)
+        track_ids, values = target.load_audio_features(["energy", "tempo"])
+        self.assertEqual(list(track_ids), ["t1"])
+        self.assertEqual(values.tolist(), [[0.5, 120.0]])
+        self.assertEqual(target.missing_ids("audio_feature"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
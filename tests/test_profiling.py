@@ -0,0 +1,69 @@
+"""Runs a small synthetic sync under the profiler and checks it against budgets."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+import dataclasses
+import os
+import tempfile
+import unittest
+
+from carillon.database_worker import DatabaseConfig, DatabaseWorker
+from carillon.profiling import (
+    DEFAULT_BUDGET,
+    BudgetExceeded,
+    LibrarySize,
+    ProfileBudget,
+    Profiler,
+    fake_spotify_worker,
+    profile_sync,
+)
+
+SMALL_LIBRARY = LibrarySize(tracks=600, artists=60, albums=120, playlists=5, playlist_length=50, saved_albums=10)
+
+
+class ProfileSyncTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.tmp = tempfile.TemporaryDirectory()
+        db = DatabaseWorker(config=DatabaseConfig(db_filename=os.path.join(cls.tmp.name, "profile.db")))
+        db.init()
+        spotify = fake_spotify_worker(db, SMALL_LIBRARY)
+        cls.profiler = Profiler(cls.tmp.name, api=spotify.sp)
+        cls.track_count = profile_sync(db, spotify, cls.profiler)
+        db.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.tmp.cleanup()
+
+    def test_sync_writes_a_report_per_phase(self) -> None:
+        self.assertGreater(self.track_count, 0)
+        names = [report.name for report in self.profiler.reports]
+        self.assertIn("sync/liked", names)
+        self.assertIn("sync/finish", names)
+        for report in self.profiler.reports:
+            self.assertTrue(report.stats_path.exists())
+            self.assertTrue(report.allocations_path.exists())
+            if report.rss_growth_mb is not None:
+                self.assertGreaterEqual(report.rss_growth_mb, 0)
+
+    def test_default_budget_holds(self) -> None:
+        # RSS is the whole test process's peak, so only the profile command checks it
+        budget = dataclasses.replace(DEFAULT_BUDGET, max_rss_mb=None)
+        self.profiler.check(budget, self.track_count, prefix="sync/")
+
+    def test_tight_budget_lists_every_failure(self) -> None:
+        budget = ProfileBudget(max_rss_mb=1, max_calls_per_track=0.001, max_phase_peak_mb=0.001)
+        with self.assertRaises(BudgetExceeded) as raised:
+            self.profiler.check(budget, self.track_count)
+        message = str(raised.exception)
+        self.assertIn("API calls per track", message)
+        self.assertIn("peaked at", message)
+        if self.profiler.peak_rss_mb() is not None:
+            self.assertIn("process peak RSS", message)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Checks that reconciliation plans turn the current list into the desired one."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+import random
+import unittest
+
+from carillon.reconcile import ReconcilePlan, _edit_plan, plan_reconciliation, rewrite_request_count
+
+
+def apply_plan(current: list[str], plan: ReconcilePlan) -> list[str]:
+    """Replays a plan the way Spotify applies its requests."""
+    if plan.replacement is not None:
+        return list(plan.replacement)
+    tracks = list(current)
+    for track_id, position in sorted(plan.removals, key=lambda removal: removal[1], reverse=True):
+        assert tracks[position] == track_id
+        del tracks[position]
+    for start, insert_before, length in plan.moves:
+        block = tracks[start:start + length]
+        del tracks[start:start + length]
+        target = insert_before - length if insert_before > start else insert_before
+        tracks[target:target] = block
+    for position, track_ids in plan.insertions:
+        tracks[position:position] = track_ids
+    return tracks
+
+
+class PlanReconciliationTest(unittest.TestCase):
+    def test_random_plans_reach_desired(self) -> None:
+        rng = random.Random(0)
+        for _ in range(2000):
+            pool = [f"t{index}" for index in range(rng.randint(1, 40))]
+            current = [rng.choice(pool) for _ in range(rng.randint(0, 60))]
+            if rng.random() < 0.5:
+                desired = list(current)
+                rng.shuffle(desired)
+                desired = desired[: rng.randint(0, len(desired))] + [rng.choice(pool) for _ in range(rng.randint(0, 5))]
+            else:
+                desired = [rng.choice(pool) for _ in range(rng.randint(0, 60))]
+            edit = _edit_plan("pl", "s", current, desired)
+            self.assertIsNone(edit.replacement)
+            self.assertEqual(apply_plan(current, edit), desired, (current, desired, edit))
+            plan = plan_reconciliation("pl", "s", current, desired)
+            self.assertEqual(apply_plan(current, plan), desired, (current, desired, plan))
+            self.assertLessEqual(plan.request_count, min(edit.request_count, rewrite_request_count(len(desired))))
+            self.assertEqual(bool(plan), current != desired)
+
+    def test_block_move_is_one_request(self) -> None:
+        current = [f"t{index}" for index in range(300)]
+        desired = current[:50] + current[150:250] + current[50:150] + current[250:]
+        plan = plan_reconciliation("pl", "s", current, desired)
+        self.assertEqual(len(plan.moves), 1)
+        self.assertEqual(apply_plan(current, plan), desired)
+
+    def test_shuffled_blocks_move_as_blocks(self) -> None:
+        current = [f"t{index}" for index in range(300)]
+        blocks = [current[start:start + 30] for start in range(0, 300, 30)]
+        random.Random(1).shuffle(blocks)
+        desired = [track_id for block in blocks for track_id in block]
+        plan = _edit_plan("pl", "s", current, desired)
+        self.assertLess(len(plan.moves), len(blocks))
+        self.assertEqual(apply_plan(current, plan), desired)
+
+    def test_reversal_rewrites(self) -> None:
+        current = [f"t{index}" for index in range(300)]
+        plan = plan_reconciliation("pl", "s", current, current[::-1])
+        self.assertEqual(plan.replacement, current[::-1])
+        self.assertEqual(plan.request_count, 3)
+
+    def test_small_edit_keeps_the_diff(self) -> None:
+        current = [f"t{index}" for index in range(300)]
+        desired = ["new"] + current[1:150] + [current[0]] + current[150:]
+        plan = plan_reconciliation("pl", "s", current, desired)
+        self.assertIsNone(plan.replacement)
+        self.assertEqual(plan.request_count, 2)
+        self.assertEqual(apply_plan(current, plan), desired)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Checks that a library written by the C# app or an older build is migrated once."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from carillon.database_worker import SCHEMA_VERSION, DatabaseConfig, DatabaseWorker
+
+# The library tables as they were before any derived table existed.
+BASELINE_SCHEMA = """
+CREATE TABLE Settings (Key TEXT PRIMARY KEY, Value TEXT NOT NULL);
+CREATE TABLE Playlists (
+    Id TEXT PRIMARY KEY, Name TEXT, ImageURL TEXT, ImagePath TEXT, Description TEXT, SnapshotID TEXT, TrackIDs TEXT
+);
+CREATE TABLE Albums (Id TEXT PRIMARY KEY, Name TEXT, ImageURL TEXT, ImagePath TEXT, ArtistIDs TEXT);
+CREATE TABLE Tracks (
+    Id TEXT PRIMARY KEY, SongID TEXT, Name TEXT, AlbumId TEXT, ArtistIds TEXT,
+    DiscNumber INTEGER, DurationMs INTEGER, Explicit INTEGER, PreviewUrl TEXT, TrackNumber INTEGER
+);
+CREATE TABLE Artists (Id TEXT PRIMARY KEY, Name TEXT, ImageURL TEXT, ImagePath TEXT, Genres TEXT);
+"""
+
+
+class SchemaTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "library.db")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def open_db(self) -> tuple[DatabaseWorker, str]:
+        db = DatabaseWorker(config=DatabaseConfig(db_filename=self.path))
+        db.init()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            db.list_accounts()
+        self.addCleanup(db.close)
+        return db, output.getvalue()
+
+    def test_existing_library_is_migrated_once(self) -> None:
+        connection = sqlite3.connect(self.path)
+        connection.executescript(BASELINE_SCHEMA)
+        connection.executescript(
+            """
+            INSERT INTO Artists VALUES ('ar1', 'Band', '', '', 'jazz, soul');
+            INSERT INTO Albums VALUES ('al1', 'Record', '', '', 'ar1');
+            INSERT INTO Tracks VALUES ('t1', 'SNG1', 'Tune', 'al1', 'ar1', 1, 1000, 0, '', 1);
+            """
+        )
+        connection.close()
+
+        db, output = self.open_db()
+        self.assertIn("[Schema]", output)
+        self.assertEqual(db._connection.execute("PRAGMA user_version;").fetchone()[0], SCHEMA_VERSION)
+        self.assertEqual(db.tracks_by_genres(["soul"]), ["t1"])
+        self.assertEqual(db.search("band", kinds=["track"])[0]["id"], "t1")
+
+        db.close()
+        _, output = self.open_db()
+        self.assertEqual(output, "")
+
+    def test_new_database_skips_the_migration(self) -> None:
+        _, output = self.open_db()
+        self.assertEqual(output, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""Checks search ranking when a query matches more rows than are ranked."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+import os
+import tempfile
+import unittest
+
+from carillon.database_worker import SEARCH_CANDIDATES, DatabaseConfig, DatabaseWorker, SyncChanges
+
+
+def track(track_id: str, name: str) -> dict:
+    return {"id": track_id, "name": name, "artists": [{"id": "ar0"}], "album": {"id": "al0"}, "duration_ms": 1000}
+
+
+class SearchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DatabaseWorker(config=DatabaseConfig(db_filename=os.path.join(self.tmp.name, "search.db")))
+        self.db.init()
+
+    def tearDown(self) -> None:
+        self.db.close()
+        self.tmp.cleanup()
+
+    def write_tracks(self, tracks: list[dict]) -> None:
+        changes = SyncChanges()
+        self.db.write_catalog("track", tracks, changes)
+        self.db.finish_sync(changes, quiet=True)
+
+    def test_late_exact_match_beats_common_prefix(self) -> None:
+        self.write_tracks([track(f"t{index}", f"Lovely Day {index}") for index in range(SEARCH_CANDIDATES + 300)])
+        self.write_tracks([track("love", "Love")])
+
+        results = self.db.search("love", kinds=["track"], limit=5)
+        self.assertEqual(results[0]["id"], "love")
+        self.assertEqual(len(results), 5)
+
+    def test_every_word_narrows_past_the_candidate_limit(self) -> None:
+        count = SEARCH_CANDIDATES + 300
+        self.write_tracks([track(f"t{index}", f"Lovely Day {index}") for index in range(count)])
+
+        results = self.db.search(f"lovely day {count - 1}", kinds=["track"], limit=1)
+        self.assertEqual(results[0]["id"], f"t{count - 1}")
+
+
+if __name__ == "__main__":
+    unittest.main()
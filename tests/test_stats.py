@@ -0,0 +1,60 @@
+"""Checks that liked and unsorted counts are kept per account."""
+
+from __future__ import annotations
+
+__author__ = "ChatGPT Codex"
+
+import os
+import tempfile
+import unittest
+
+from carillon.database_worker import DatabaseConfig, DatabaseWorker, SyncChanges
+
+
+def playlist(playlist_id: str) -> dict:
+    return {"id": playlist_id, "name": playlist_id, "description": "", "snapshot_id": "s1", "images": []}
+
+
+class AccountStatsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DatabaseWorker(config=DatabaseConfig(db_filename=os.path.join(self.tmp.name, "stats.db")))
+        self.db.init()
+        self.db.add_account("a")
+        self.db.add_account("b")
+        changes = SyncChanges()
+        self.db.write_catalog(
+            "track",
+            [{"id": f"t{index}", "name": f"Song {index}", "artists": [{"id": "ar1"}], "album": {"id": "al1"}} for index in range(3)],
+            changes,
+        )
+        self.db.write_catalog("artist", [{"id": "ar1", "name": "Artist", "genres": ["jazz"]}], changes)
+        # Account a files t0 in its playlist; b likes t0 and t1 but follows nothing
+        self.db.write_account_library("a", ["pa"], [(playlist("pa"), ["t0"])], [], [], [("t0", "")], changes)
+        self.db.write_account_library("b", [], [], [], [], [("t0", ""), ("t1", "")], changes)
+        self.db.finish_sync(changes, quiet=True)
+
+    def tearDown(self) -> None:
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_other_accounts_playlists_do_not_sort_songs(self) -> None:
+        self.assertEqual(self.db.library_stats("a")["unsorted"], 0)
+        self.assertEqual(self.db.library_stats("b")["unsorted"], 2)
+        self.assertEqual(self.db.genre_stats(account_id="b")[0]["unsorted"], 2)
+        self.assertEqual(self.db.artist_stats(account_id="a")[0]["unsorted"], 0)
+        self.assertEqual({song["id"] for song in self.db.sort_queue(unsorted=True, account_id="b")}, {"t0", "t1"})
+        self.assertEqual(self.db.sort_queue(unsorted=True, account_id="a"), [])
+
+    def test_unfollowing_a_playlist_unsorts_its_songs(self) -> None:
+        changes = SyncChanges()
+        self.db.write_account_library("a", [], [], [], [], [("t0", "")], changes)
+        self.db.finish_sync(changes, quiet=True)
+
+        self.assertEqual(self.db.library_stats("a")["unsorted"], 1)
+        self.assertEqual(self.db.artist_stats(account_id="a")[0]["unsorted"], 1)
+        self.assertEqual([song["id"] for song in self.db.sort_queue(unsorted=True, account_id="a")], ["t0"])
+
+
+if __name__ == "__main__":
+    unittest.main()